@@ -2,10 +2,14 @@ import streamlit as st
 import numpy as np
 from io import StringIO
 import pandas as pd
+import lz4.frame
 import streamlit.components.v1 as components
 import subprocess
 import tempfile
+import time
 import os
+import hashlib
+import functools
 # import sys
 
 # def install(package):
@@ -16,111 +20,293 @@ import os
 import py3Dmol
 from rdkit import Chem
 from rdkit.Chem import AllChem
-# Define the showmol function
-def showmol(view, width=800, height=500):
-    """
-    Renders the py3Dmol viewer in a Streamlit app
-    """
-    view.zoomTo()
-    html = view._make_html()
-    components.html(html, width=width, height=height)
-
-def render_mol(xyz, show_labels=False, show_indices=False, view="CPK"):
-    xyzview = py3Dmol.view(width=800, height=400)
-    xyzview.addModel(xyz, "xyz")
-    
-    if view == "CPK":
-        xyzview.setStyle({'stick':{}, 'sphere':{'radius':0.5}})
-    elif view == "VdW":
-        xyzview.setStyle({'sphere':{}})
-    
-    if show_labels or show_indices:
-        atoms, coordinates, _ = parse_xyz_string(xyz)
-        if show_labels:
-            for atom, coord in zip(atoms, coordinates):
-                xyzview.addLabel(atom, {'position': {'x': coord[0]-0.05, 'y': coord[1]-0.05, 'z': coord[2]-0.05},
-                                      'fontColor': 'red', 'alignment': 'center'})
-        if show_indices:
-            for i, coord in enumerate(coordinates):
-                xyzview.addLabel(f"{i+1}", {'position': {'x': coord[0], 'y': coord[1], 'z': coord[2]},
-                                          'fontColor': 'red', 'alignment': 'center',
-                                          'offset': {'x': 1, 'y': 0, 'z': 0}})
-    
-    xyzview.zoomTo()
-    showmol(xyzview, height=400, width=800)
+ELEMENTS = [Chem.GetPeriodicTable().GetElementSymbol(z) for z in range(1, 119)]
+
+# Molecule viewer component; frontend/index.html keeps a single 3Dmol.js viewer alive across reruns
+_molviewer = components.declare_component(
+    "molviewer", path=os.path.join(os.path.dirname(os.path.abspath(__file__)), "frontend"))
+
+# Browser-side step slider for the trajectory viewer; VIEWER and NUM_FRAMES are substituted per render
+TRAJECTORY_CONTROLS = """
+<div style="font-family: sans-serif; font-size: 14px; width: 800px;">
+  <input id="step_VIEWER" type="range" min="0" max="LAST_FRAME" value="0" style="width: 100%;">
+  <span id="label_VIEWER">Showing structure 1 of NUM_FRAMES</span>
+</div>
+<script>
+(function() {
+  var slider = document.getElementById("step_VIEWER");
+  var label = document.getElementById("label_VIEWER");
+  function showFrame(n) {
+    if (!VIEWER) return;
+    slider.value = n;
+    label.textContent = "Showing structure " + (n + 1) + " of NUM_FRAMES";
+    Promise.resolve(VIEWER.setFrame(n)).then(function() { VIEWER.render(); });
+  }
+  slider.addEventListener("input", function() { showFrame(parseInt(slider.value)); });
+  // Lets a parent frame drive the viewer with postMessage({trajectoryFrame: n})
+  window.addEventListener("message", function(event) {
+    if (event.data && event.data.trajectoryFrame !== undefined) showFrame(event.data.trajectoryFrame);
+  });
+})();
+</script>
+"""
+
+VIEW_STYLES = {
+    "CPK": {'stick':{}, 'sphere':{'radius':0.5}},
+    "VdW": {'sphere':{}},
+}
+
+def trajectory_html(trajectory_xyz, num_frames, view="CPK", width=800, height=400):
+    """
+    Builds a page that renders all frames of a multi-structure XYZ string in a
+    single py3Dmol viewer; stepping through them happens in the browser without
+    a Streamlit rerun
+    """
+    trajview = py3Dmol.view(width=width, height=height)
+    trajview.addModelsAsFrames(trajectory_xyz, "xyz")
+    trajview.setStyle(VIEW_STYLES[view])
+    # Fitted once to frame 0; setFrame in TRAJECTORY_CONTROLS leaves the camera alone
+    trajview.zoomTo()
+    html = trajview._make_html()
+    html += (TRAJECTORY_CONTROLS.replace("VIEWER", f"viewer_{trajview.uniqueid}")
+             .replace("LAST_FRAME", str(num_frames-1))
+             .replace("NUM_FRAMES", str(num_frames)))
+    return html
+
+def render_mol(xyz, show_labels=False, show_indices=False, view="CPK", key=None, first_render=None):
+    """
+    Renders a structure in the molecule viewer component. Give each viewer on
+    the page its own key so its browser-side viewer is reused between reruns.
+    The camera is fitted to the molecule on the first render of a key only
+    (tracked in st.session_state._zoomed) unless first_render says otherwise
+    """
+    zoomed = st.session_state.setdefault('_zoomed', set())
+    if first_render is None:
+        first_render = key not in zoomed
+    zoomed.add(key)
+    
+    # Element labels are one addPropertyLabels("elem") call in the frontend and sit on the atom
+    # centre; the old per-atom -0.05 Å position nudge is not expressible there and is dropped.
+    # Index labels need 1-based text, which no 3Dmol atom property provides, so they stay
+    # individual addLabel specs (added in one JS loop by the component)
+    labels = []
+    if show_indices:
+        _, coordinates, _ = parse_xyz_string(xyz)
+        labels = [{'text': f"{i+1}",
+                   'style': {'position': {'x': float(x), 'y': float(y), 'z': float(z)},
+                             'fontColor': 'red', 'alignment': 'center',
+                             'offset': {'x': 1, 'y': 0, 'z': 0}}}
+                  for i, (x, y, z) in enumerate(coordinates)]
+    
+    _molviewer(xyz=xyz, style=VIEW_STYLES[view], element_labels=show_labels,
+               label_style={'fontColor': 'red', 'alignment': 'center'}, labels=labels,
+               preserve_camera=not first_render, width=800, height=400, key=key, default=None)
+
+def _read_atom_block(block, num_atoms=None):
+    """
+    Parse XYZ atom rows into an array of symbols and a float32 (N, 3) coordinate
+    array, reading at most num_atoms rows. Both columns are parsed in one C pass
+    """
+    try:
+        df = pd.read_csv(StringIO(block), sep=r"\s+", header=None, usecols=[0, 1, 2, 3], nrows=num_atoms,
+                         dtype={0: str, 1: np.float32, 2: np.float32, 3: np.float32}, engine="c",
+                         keep_default_na=False, na_filter=False)  # keep symbols like "NA" (sodium) as text
+    except ValueError:
+        # Imported on demand so numba/LLVM only load when a file actually needs the fallback
+        from xyz_kernels import parse_atom_bytes
+        return parse_atom_bytes(block, num_atoms)
+    return df[0].to_numpy(), df[[1, 2, 3]].to_numpy(dtype=np.float32, copy=False)
 
 @st.cache_data
 def parse_xyz_string(xyz_string):
-    lines = xyz_string.strip().split('\n')
-    num_atoms = int(lines[0])
-    comment = lines[1]
-    atoms = []
-    coordinates = []
-    
-    for i in range(2, num_atoms+2):
-        if lines[i].strip():
-            atom_data = lines[i].split()
-            atoms.append(atom_data[0])
-            coordinates.append([float(x) for x in atom_data[1:4]])
+    # Split off the two header lines only; the atom rows go to the parser as a single slice
+    header = xyz_string.lstrip().split('\n', 2)
+    num_atoms = int(header[0])
+    comment = header[1]
+    body = header[2] if len(header) > 2 else ""
+    atoms, coordinates = _read_atom_block(body, num_atoms)
+    # The fallback parser skips rows it cannot read; never hand on a silently shortened structure
+    if len(atoms) != num_atoms:
+        raise ValueError(f"expected {num_atoms} atoms but could read {len(atoms)}; check the coordinate rows")
     
     return atoms, coordinates, comment
 
 @st.cache_data
 def write_xyz_string(atoms, coordinates, comment="Generated by Streamlit app"):
-    xyz_content = f"{len(atoms)}\n{comment}\n"
-    for atom, coord in zip(atoms, coordinates):
-        xyz_content += f"{atom} {coord[0]:.6f} {coord[1]:.6f} {coord[2]:.6f}\n"
-    return xyz_content
+    atoms = np.asarray(atoms, dtype=str)
+    coordinates = np.asarray(coordinates, dtype=np.float32)
+    # Structured array lets numpy format all rows in C instead of one f-string per atom
+    records = np.empty(len(atoms), dtype=[('atom', atoms.dtype), ('x', 'f4'), ('y', 'f4'), ('z', 'f4')])
+    records['atom'] = atoms
+    records['x'], records['y'], records['z'] = coordinates.T
+    buf = StringIO()
+    np.savetxt(buf, records, fmt="%-2s %12.6f %12.6f %12.6f", header=f"{len(atoms)}\n{comment}", comments='')
+    return buf.getvalue()
 
-@st.cache_data
-def parse_trajectory_xyz(xyz_string):
-    """Parse a multi-structure XYZ file into a list of (atoms, coordinates) tuples"""
-    structures = []
-    lines = xyz_string.strip().split('\n')
+def index_trajectory(raw):
+    """
+    Locate the frames of a multi-structure XYZ file given as bytes. Returns an
+    int64 (F, 2) array of [start, end) byte offsets; only the atom-count line of
+    each frame is read, lines that are not a frame header are skipped
+    """
+    newlines = np.flatnonzero(np.frombuffer(raw, dtype=np.uint8) == 10)
+    bounds = np.concatenate(([0], newlines + 1))
+    if not raw.endswith(b"\n"):
+        bounds = np.append(bounds, len(raw))
+    num_lines = len(bounds) - 1
     
-    i = 0
-    while i < len(lines):
+    offsets = []
+    line = 0
+    while line + 1 < num_lines:
         try:
-            num_atoms = int(lines[i])
-            comment = lines[i+1]
-            atoms = []
-            coordinates = []
-            
-            for j in range(i+2, i+2+num_atoms):
-                if j < len(lines):
-                    atom_data = lines[j].split()
-                    if len(atom_data) >= 4:
-                        atoms.append(atom_data[0])
-                        coordinates.append([float(x) for x in atom_data[1:4]])
-            
-            if atoms and coordinates:
-                structures.append((atoms, coordinates))
-            
-            i += num_atoms + 2
-        except (ValueError, IndexError):
-            i += 1
-    
-    return structures
+            num_atoms = int(raw[bounds[line]:bounds[line+1]])
+        except ValueError:
+            line += 1
+            continue
+        if num_atoms <= 0:
+            line += 1
+            continue
+        next_line = min(line + num_atoms + 2, num_lines)
+        offsets.append((bounds[line], bounds[next_line]))
+        line = next_line
+    return np.array(offsets, dtype=np.int64).reshape(-1, 2)
+
+def _traj_bytes():
+    """Decompress the trajectory stored in session state"""
+    return lz4.frame.decompress(st.session_state.trajectory_xyz)
+
+def session_trajectory_index():
+    """
+    index_trajectory for the session's trajectory, memoized in session state on
+    (id, len) of the compressed log. Only the offsets are kept; the log itself
+    stays compressed and is decompressed when a viewer is built
+    """
+    trajectory = st.session_state.trajectory_xyz
+    key = (id(trajectory), len(trajectory))
+    cached = st.session_state.get('_traj_cache')
+    if cached is None or cached[0] != key:
+        cached = (key, index_trajectory(_traj_bytes()))
+        st.session_state._traj_cache = cached
+    return cached[1]
+
+def session_trajectory_html(view):
+    """
+    Trajectory viewer page for the session's trajectory and view style, built
+    once per (trajectory, view) and kept lz4-compressed in session state.
+    py3Dmol's element ids are time-based, so reusing the identical string is
+    what keeps the iframe from reloading on reruns
+    """
+    offsets = session_trajectory_index()
+    key = st.session_state._traj_cache[0]
+    pages = st.session_state.get('_traj_html')
+    if pages is None or pages[0] != key:
+        pages = (key, {})
+        st.session_state._traj_html = pages
+    if view not in pages[1]:
+        raw = _traj_bytes()
+        frames = b"".join(raw[start:end] for start, end in offsets).decode()
+        pages[1][view] = lz4.frame.compress(trajectory_html(frames, len(offsets), view).encode())
+    return lz4.frame.decompress(pages[1][view]).decode()
 
 @st.cache_data
+def load_upload(raw_bytes):
+    """Parse an uploaded XYZ file and build the coordinate DataFrame once per distinct upload"""
+    atoms, coordinates, _ = parse_xyz_string(raw_bytes.decode())
+    
+    # Symbols outside the periodic table are kept as extra categories
+    atom_options = ELEMENTS + sorted(set(atoms) - set(ELEMENTS))
+    df = pd.DataFrame({
+        'Atom': pd.Categorical(atoms, categories=atom_options),
+        'X': coordinates[:, 0],
+        'Y': coordinates[:, 1],
+        'Z': coordinates[:, 2]
+    })
+    return df
+
 def get_trajectory_from_xtb(tmpdir):
+    """The xTB optimization log, lz4-compressed; _traj_bytes() restores it once stored in session state"""
     try:
-        with open(os.path.join(tmpdir, "xtbopt.log"), 'r') as f:
-            trajectory_content = f.read()
+        with open(os.path.join(tmpdir, "xtbopt.log"), 'rb') as f:
+            trajectory_content = lz4.frame.compress(f.read())
         return trajectory_content
     except FileNotFoundError:
         st.error("Trajectory file not found")
         return None
 
-@st.cache_data
-def run_xtb_optimization(xyz_content):
+# Explicit thread settings for xtb so it does not inherit whatever the server environment has
+XTB_THREADS = os.cpu_count() or 1
+XTB_ENV = {
+    **os.environ,
+    "OMP_NUM_THREADS": str(XTB_THREADS),
+    "MKL_NUM_THREADS": str(XTB_THREADS),
+    "OMP_STACKSIZE": "512m",
+}
+
+def canonical_xyz(xyz_content):
+    """Re-emit an XYZ string with a fixed comment and 6-decimal coordinates so equivalent inputs match"""
+    atoms, coordinates, _ = parse_xyz_string(xyz_content)
+    return write_xyz_string(atoms, coordinates)
+
+def run_xtb_optimization(xyz_content, on_step=None):
+    """
+    Optimize a structure with xTB, reusing earlier results for chemically
+    identical inputs. on_step, if given, is called with the number of
+    optimization steps written so far while xtb is running
+    """
+    xyz_content = canonical_xyz(xyz_content)
+    key = hashlib.sha256(xyz_content.encode()).hexdigest()
+    return _run_xtb_optimization(key, xyz_content, on_step)
+
+def _count_frames(path, start=0):
+    """
+    Count the complete frames xtb has appended to its optimization log since
+    byte offset start. Returns (frames, offset just past the last complete
+    frame) so the next poll only reads what was written in between
+    """
+    try:
+        with open(path, "rb") as f:
+            f.seek(start)
+            raw = f.read()
+    except FileNotFoundError:
+        return 0, start
+    offsets = index_trajectory(raw)
+    if len(offsets):
+        # index_trajectory keeps a truncated last frame; here it is still being written
+        last_start, last_end = offsets[-1]
+        num_atoms = int(raw[last_start:raw.index(b"\n", last_start)])
+        if raw.count(b"\n", last_start, last_end) < num_atoms + 2:
+            offsets = offsets[:-1]
+    if not len(offsets):
+        return 0, start
+    return len(offsets), start + int(offsets[-1, 1])
+
+@st.cache_data(show_spinner=False)  # progress is shown by the caller's st.status
+def _run_xtb_optimization(key, _xyz_content, _on_step=None):
+    # Cached on the content hash only; the leading underscores keep Streamlit from hashing the text and callback
     with tempfile.TemporaryDirectory() as tmpdir:
         input_file = os.path.join(tmpdir, "input.xyz")
         with open(input_file, "w") as f:
-            f.write(xyz_content)
+            f.write(_xyz_content)
         
         try:
-            subprocess.run(["xtb", input_file, "--opt"], cwd=tmpdir, check=True)
+            # Poll instead of blocking in subprocess.run so progress can be reported while xtb runs
+            proc = subprocess.Popen(["xtb", input_file, "--opt", "--parallel", str(XTB_THREADS)], cwd=tmpdir,
+                                    stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, env=XTB_ENV)
+            steps, log_pos = 0, 0
+            try:
+                while proc.poll() is None:
+                    time.sleep(0.5)
+                    if _on_step:
+                        new_steps, log_pos = _count_frames(os.path.join(tmpdir, "xtbopt.log"), log_pos)
+                        steps += new_steps
+                        _on_step(steps)
+            finally:
+                # Stop xtb if the script run is interrupted (rerun, session closed)
+                if proc.poll() is None:
+                    proc.kill()
+                    proc.wait()
+            if proc.returncode != 0:
+                raise subprocess.CalledProcessError(proc.returncode, proc.args)
             
             with open(os.path.join(tmpdir, "xtbopt.xyz"), "r") as f:
                 optimized_xyz = f.read()
@@ -134,40 +320,9 @@ def run_xtb_optimization(xyz_content):
             st.error("xTB is not installed or not in PATH")
             return None, None
 
-# Set page config
-st.set_page_config(page_title="Molecular Viewer", layout="wide")
-
-# Initialize session state
-if 'optimized_xyz' not in st.session_state:
-    st.session_state.optimized_xyz = None
-if 'trajectory_xyz' not in st.session_state:
-    st.session_state.trajectory_xyz = None
-if 'optimization_complete' not in st.session_state:
-    st.session_state.optimization_complete = False
-
-st.title("Molecular Viewer and Editor")
-
-uploaded_file = st.file_uploader("Upload XYZ file", type="xyz")
-if uploaded_file:
-    xyz_string = uploaded_file.getvalue().decode()
-    atoms, coordinates, comment = parse_xyz_string(xyz_string)
-    
-    # Create DataFrame for coordinates
-    df = pd.DataFrame({
-        'Atom': atoms,
-        'X': [coord[0] for coord in coordinates],
-        'Y': [coord[1] for coord in coordinates],
-        'Z': [coord[2] for coord in coordinates]
-    })
-    
-    # Display and edit coordinates
-    st.subheader("Atomic Coordinates")
-    edited_df = st.data_editor(df)
-    
-    # Update coordinates from edited DataFrame
-    atoms = edited_df['Atom'].tolist()
-    coordinates = edited_df[['X', 'Y', 'Z']].values.tolist()
-    
+@st.fragment
+def viewer_fragment(xyz_string):
+    """Viewer controls, xTB run and results; widget changes here rerun only this function"""
     # View type selection
     view_type = st.selectbox('Choose view type', ("CPK", "VdW"))
     
@@ -181,20 +336,25 @@ if uploaded_file:
     with col2:
         show_indices = st.toggle("Show Atom Indices")
     
-    # Create XYZ string for viewer and render molecule
-    xyz_string = write_xyz_string(atoms, coordinates)
-    render_mol(xyz_string, show_labels, show_indices, view_type)
+    render_mol(xyz_string, show_labels, show_indices, view_type, key="molecule")
     
     # Run xTB optimization
     if st.button("Run GFN2-xTB Optimization"):
-        with st.spinner("Running optimization..."):
-            optimized_xyz, trajectory_xyz = run_xtb_optimization(xyz_string)
+        with st.status("Running optimization...") as status:
+            optimized_xyz, trajectory_xyz = run_xtb_optimization(
+                xyz_string, lambda steps: status.update(label=f"Running optimization... step {steps}"))
             if optimized_xyz:
+                status.update(label="Optimization finished", state="complete")
                 st.session_state.optimized_xyz = optimized_xyz
+                # Already lz4-compressed by run_xtb_optimization; _traj_bytes() restores it
                 st.session_state.trajectory_xyz = trajectory_xyz
+                st.session_state._traj_cache = None
+                st.session_state._traj_html = None
+                st.session_state.setdefault('_zoomed', set()).discard("optimized")
                 st.session_state.optimization_complete = True
                 st.rerun()
             else:
+                status.update(label="Optimization failed", state="error")
                 st.error("Optimization failed. Please check if xTB is installed correctly.")
     
     # Show optimization results if available
@@ -212,31 +372,70 @@ if uploaded_file:
         
         # Show optimized structure
         st.subheader("Optimized Structure")
-        render_mol(st.session_state.optimized_xyz, show_labels, show_indices, view_type)
+        render_mol(st.session_state.optimized_xyz, show_labels, show_indices, view_type, key="optimized")
         
         # Trajectory visualization
         if st.session_state.trajectory_xyz:
-            st.subheader("Optimization Trajectory")
-            
-            st.download_button(
-                label="Download complete trajectory",
-                data=st.session_state.trajectory_xyz,
-                file_name="trajectory.xyz",
-                mime="chemical/x-xyz"
-            )
-            
-            # Parse trajectory
-            trajectory_structures = parse_trajectory_xyz(st.session_state.trajectory_xyz)
-            
-            if trajectory_structures:
-                # Trajectory viewer
-                step = st.slider("Trajectory Step", 0, len(trajectory_structures)-1, 0)
-                
-                # Create XYZ string for selected trajectory step
-                step_atoms, step_coordinates = trajectory_structures[step]
-                step_xyz = write_xyz_string(step_atoms, step_coordinates)
-                render_mol(step_xyz, show_labels, show_indices, view_type)
-                
-                st.text(f"Showing structure {step+1} of {len(trajectory_structures)}")
+            trajectory_fragment(view_type)
+
+@st.fragment
+def trajectory_fragment(view_type):
+    """Trajectory download and viewer, isolated from reruns of the optimized-structure view"""
+    st.subheader("Optimization Trajectory")
+    
+    # Deferred: the log is only decompressed when the button is clicked. The compressed bytes are
+    # bound here because the callable runs outside the script thread, without st.session_state
+    st.download_button(
+        label="Download complete trajectory",
+        data=functools.partial(lz4.frame.decompress, st.session_state.trajectory_xyz),
+        file_name="trajectory.xyz",
+        mime="chemical/x-xyz"
+    )
+    
+    # Frames are sliced out of the raw log by offset; no frame is parsed on the Python side
+    offsets = session_trajectory_index()
+    
+    if len(offsets):
+        # Trajectory viewer; frames are stepped through in the browser and the page is
+        # identical across reruns, so the iframe is not reloaded
+        st.iframe(session_trajectory_html(view_type), width=800, height=460)
+
+# Set page config
+st.set_page_config(page_title="Molecular Viewer", layout="wide")
+
+# Initialize session state
+if 'optimized_xyz' not in st.session_state:
+    st.session_state.optimized_xyz = None
+if 'trajectory_xyz' not in st.session_state:
+    st.session_state.trajectory_xyz = None
+if 'optimization_complete' not in st.session_state:
+    st.session_state.optimization_complete = False
+
+st.title("Molecular Viewer and Editor")
+
+uploaded_file = st.file_uploader("Upload XYZ file", type="xyz")
+if uploaded_file:
+    # A new file gets its camera fitted again
+    if st.session_state.get('_upload_id') != uploaded_file.file_id:
+        st.session_state._upload_id = uploaded_file.file_id
+        st.session_state._zoomed = set()
+    try:
+        df = load_upload(uploaded_file.getvalue())
+    except ValueError as e:
+        st.error(f"Could not read {uploaded_file.name}: {e}")
+        st.stop()
+    
+    # Display and edit coordinates
+    st.subheader("Atomic Coordinates")
+    atom_options = df['Atom'].cat.categories.tolist()
+    edited_df = st.data_editor(df, column_config={'Atom': st.column_config.SelectboxColumn(options=atom_options)})
+    
+    # Update coordinates from edited DataFrame; the float32 columns are reused without a copy where possible
+    atoms = edited_df['Atom'].to_numpy()
+    coordinates = edited_df[['X', 'Y', 'Z']].to_numpy(dtype=np.float32, copy=False)
+    
+    # Create XYZ string for viewer; everything below reruns on its own when its widgets change
+    xyz_string = write_xyz_string(atoms, coordinates)
+    viewer_fragment(xyz_string)
 else:
     st.info("Please upload an XYZ file to start.")
@@ -0,0 +1,91 @@
+import numpy as np
+
+from streamlit_app import _count_frames, index_trajectory
+from xyz_kernels import parse_atom_bytes
+
+FRAME = b"2\nenergy: -1.0\nH 0 0 0\nH 0 0 0.74\n"
+
+
+def test_extra_columns_are_ignored():
+    atoms, coordinates = parse_atom_bytes("C 1.0 2.0 3.0 0.12 -0.5\nH 0.5 0.5 0.5\n")
+    assert atoms.tolist() == ["C", "H"]
+    np.testing.assert_allclose(coordinates, [[1.0, 2.0, 3.0], [0.5, 0.5, 0.5]])
+
+
+def test_trailing_comments_are_ignored():
+    atoms, coordinates = parse_atom_bytes("O .5 1e2 -0.0001 # oxygen\nN\t1 2 3   ! nitrogen\n")
+    assert atoms.tolist() == ["O", "N"]
+    np.testing.assert_allclose(coordinates, [[0.5, 100.0, -0.0001], [1.0, 2.0, 3.0]], rtol=1e-6)
+
+
+def test_exponents():
+    atoms, coordinates = parse_atom_bytes("H 1.25D-1 -2.5e1 3E+2\nH +1.5d0 2.0E0 -1d1\n")
+    assert atoms.tolist() == ["H", "H"]
+    np.testing.assert_allclose(coordinates, [[0.125, -25.0, 300.0], [1.5, 2.0, -10.0]], rtol=1e-6)
+
+
+def test_rows_without_three_coordinates_are_skipped():
+    block = "C 1 2 3\n\nbad row here\nN 1 2\nH 1.0x 2 3\nO 4 5 6\n"
+    atoms, coordinates = parse_atom_bytes(block)
+    assert atoms.tolist() == ["C", "O"]
+    np.testing.assert_allclose(coordinates, [[1, 2, 3], [4, 5, 6]])
+
+
+def test_num_atoms_limits_rows():
+    atoms, coordinates = parse_atom_bytes("C 1 2 3\nO 4 5 6\nN 7 8 9\n", num_atoms=2)
+    assert atoms.tolist() == ["C", "O"]
+    assert coordinates.dtype == np.float32
+    assert coordinates.shape == (2, 3)
+
+
+def test_crlf_line_endings():
+    atoms, coordinates = parse_atom_bytes("Na 0 0 0\r\nCl 2.8 0 0\r\n")
+    assert atoms.tolist() == ["Na", "Cl"]
+    np.testing.assert_allclose(coordinates, [[0, 0, 0], [2.8, 0, 0]], rtol=1e-6)
+
+
+def test_index_trajectory_keeps_truncated_last_frame():
+    raw = FRAME + b"2\nenergy: -1.1\nH 0 0 0\n"
+    offsets = index_trajectory(raw)
+    assert offsets.tolist() == [[0, len(FRAME)], [len(FRAME), len(raw)]]
+
+
+def test_index_trajectory_skips_garbage_between_frames():
+    raw = FRAME + b"\n normal termination\n-3\n" + FRAME
+    offsets = index_trajectory(raw)
+    start = len(raw) - len(FRAME)
+    assert offsets.tolist() == [[0, len(FRAME)], [start, len(raw)]]
+    assert raw[offsets[1, 0]:offsets[1, 1]] == FRAME
+
+
+def test_index_trajectory_without_trailing_newline():
+    raw = FRAME + FRAME.rstrip(b"\n")
+    offsets = index_trajectory(raw)
+    assert offsets.tolist() == [[0, len(FRAME)], [len(FRAME), len(raw)]]
+
+
+def test_count_frames_ignores_frame_still_being_written(tmp_path):
+    log = tmp_path / "xtbopt.log"
+    log.write_bytes(FRAME + b"2\nenergy: -1.1\nH 0 0 0\n")
+    assert _count_frames(log) == (1, len(FRAME))
+    log.write_bytes(FRAME + FRAME.rstrip(b"\n"))
+    assert _count_frames(log) == (1, len(FRAME))
+
+
+def test_count_frames_missing_file(tmp_path):
+    assert _count_frames(tmp_path / "xtbopt.log", 5) == (0, 5)
+
+
+def test_count_frames_incremental(tmp_path):
+    log = tmp_path / "xtbopt.log"
+    log.write_bytes(FRAME * 2 + b"2\nenergy")
+    frames, pos = _count_frames(log)
+    assert (frames, pos) == (2, 2 * len(FRAME))
+
+    with open(log, "ab") as f:
+        f.write(b": -1.2\nH 0 0 0\nH 0 0 0.74\n" + FRAME)
+    more, pos = _count_frames(log, pos)
+    assert (more, pos) == (2, 4 * len(FRAME))
+    assert frames + more == len(index_trajectory(log.read_bytes()))
+
+    assert _count_frames(log, pos) == (0, pos)
@@ -0,0 +1,91 @@
+"""numba-compiled fallback parser for XYZ atom rows that pandas' reader rejects"""
+import numpy as np
+import numba
+
+@numba.njit(cache=True)
+def _parse_float(buf, pos, end):
+    """Parse one float token starting at buf[pos]; returns (value, next position, ok)"""
+    sign = 1.0
+    if pos < end and (buf[pos] == 45 or buf[pos] == 43):  # '-' / '+'
+        if buf[pos] == 45:
+            sign = -1.0
+        pos += 1
+    mantissa = 0.0
+    scale = 0
+    digits = 0
+    while pos < end and 48 <= buf[pos] <= 57:
+        mantissa = mantissa * 10.0 + (buf[pos] - 48)
+        digits += 1
+        pos += 1
+    if pos < end and buf[pos] == 46:  # '.'
+        pos += 1
+        while pos < end and 48 <= buf[pos] <= 57:
+            mantissa = mantissa * 10.0 + (buf[pos] - 48)
+            scale -= 1
+            digits += 1
+            pos += 1
+    if digits == 0:
+        return 0.0, pos, False
+    if pos < end and (buf[pos] | 32) in (100, 101):  # 'e' / 'd' exponent, either case
+        pos += 1
+        exp_sign = 1
+        if pos < end and (buf[pos] == 45 or buf[pos] == 43):
+            if buf[pos] == 45:
+                exp_sign = -1
+            pos += 1
+        exponent = 0
+        while pos < end and 48 <= buf[pos] <= 57:
+            exponent = exponent * 10 + (buf[pos] - 48)
+            pos += 1
+        scale += exp_sign * exponent
+    # The token must end at whitespace or the end of the line
+    if pos < end and buf[pos] not in (32, 9, 13):
+        return 0.0, pos, False
+    return sign * mantissa * 10.0 ** scale, pos, True
+
+@numba.njit(cache=True)
+def _parse_xyz_bytes(buf, max_atoms):
+    """
+    Scan XYZ atom rows in a uint8 buffer. Returns the (start, end) byte span of
+    each symbol and a float32 (N, 3) coordinate array; rows without three
+    numeric coordinates are skipped and anything after them is ignored
+    """
+    spans = np.empty((max_atoms, 2), dtype=np.int64)
+    coordinates = np.empty((max_atoms, 3), dtype=np.float32)
+    n = 0
+    pos = 0
+    size = len(buf)
+    while n < max_atoms and pos < size:
+        line_end = pos
+        while line_end < size and buf[line_end] != 10:  # '\n'
+            line_end += 1
+        p = pos
+        pos = line_end + 1
+        while p < line_end and buf[p] in (32, 9, 13):
+            p += 1
+        if p == line_end:
+            continue
+        start = p
+        while p < line_end and buf[p] not in (32, 9, 13):
+            p += 1
+        spans[n, 0] = start
+        spans[n, 1] = p
+        ok = True
+        for k in range(3):
+            while p < line_end and buf[p] in (32, 9, 13):
+                p += 1
+            value, p, ok = _parse_float(buf, p, line_end)
+            if not ok:
+                break
+            coordinates[n, k] = value
+        if ok:
+            n += 1
+    return spans[:n], coordinates[:n]
+
+def parse_atom_bytes(block, num_atoms=None):
+    """Fallback parser for atom rows that pandas rejects (extra columns, trailing comments, ...)"""
+    raw = block.encode()
+    max_atoms = block.count("\n") + 1 if num_atoms is None else num_atoms
+    spans, coordinates = _parse_xyz_bytes(np.frombuffer(raw, dtype=np.uint8), max_atoms)
+    atoms = np.array([raw[start:end].decode() for start, end in spans], dtype=object)
+    return atoms, coordinates